@@ -2,9 +2,11 @@
 Command-line interface for prompt-diff.
 """
 
+import os
 import sys
+import csv
 import json
-from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from typing import Optional
 
 import click
@@ -15,6 +17,7 @@ from rich.syntax import Syntax
 from rich.text import Text
 
 from .parser import parse_prompt, PromptType, get_all_variables
+from . import differ
 from .differ import (
     diff_prompts, format_unified_diff, format_side_by_side_diff,
     ChangeType, DiffResult
@@ -58,6 +61,88 @@ def format_change_type(ctype: ChangeType) -> str:
     return f"[{color}]{symbols[ctype]}[/]"
 
 
+def read_prompt_file(path: str) -> str:
+    """Read a prompt file as UTF-8 text."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def read_manifest(path: str) -> list[tuple[str, str]]:
+    """
+    Read (old_file, new_file) pairs from a batch manifest.
+
+    A .csv manifest holds one "old,new" pair per row. Any other manifest is
+    read as JSON: a list of [old, new] pairs or {"old": ..., "new": ...}
+    objects. Relative paths are resolved against the manifest's directory.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            if path.lower().endswith('.csv'):
+                entries = [row for row in csv.reader(f) if row]
+            else:
+                entries = json.load(f)
+    except (OSError, ValueError, csv.Error) as e:
+        raise click.ClickException(f"Could not read manifest {path}: {e}")
+
+    if not isinstance(entries, list):
+        raise click.ClickException(f"Manifest {path} must contain a list of file pairs")
+
+    base_dir = os.path.dirname(path)
+    pairs = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            entry = (entry.get('old'), entry.get('new'))
+        if (not isinstance(entry, (list, tuple)) or len(entry) != 2
+                or not all(isinstance(p, str) and p for p in entry)):
+            raise click.ClickException(f"Invalid manifest entry: {entry!r}")
+        pairs.append((os.path.join(base_dir, entry[0]), os.path.join(base_dir, entry[1])))
+    return pairs
+
+
+def diff_result_to_dict(result: DiffResult, show_unchanged: bool = False) -> dict:
+    """Convert a diff result into a JSON-serializable dict."""
+    return {
+        'old_path': result.old_path,
+        'new_path': result.new_path,
+        'similarity': result.similarity,
+        'added_variables': list(result.added_variables),
+        'removed_variables': list(result.removed_variables),
+        'summary': result.summary,
+        'changes': [
+            {
+                'type': d.change_type.value,
+                'element_type': d.element_type.value,
+                'old_content': d.old_content,
+                'new_content': d.new_content,
+                'old_line': d.old_line,
+                'new_line': d.new_line,
+            }
+            for d in result.element_diffs
+            if d.change_type != ChangeType.UNCHANGED or show_unchanged
+        ],
+    }
+
+
+def _init_batch_worker():
+    """Limit each batch worker process to a single scoring thread."""
+    differ.CDIST_WORKERS = 1
+
+
+def _diff_pair(pair: tuple[str, str], show_unchanged: bool = False) -> dict:
+    """
+    Diff one manifest pair; runs in a worker process.
+
+    Failures are reported in the result under 'error' rather than raised,
+    so one bad pair does not abort the rest of the batch.
+    """
+    old_file, new_file = pair
+    try:
+        result = diff_prompts(read_prompt_file(old_file), read_prompt_file(new_file), old_file, new_file)
+    except Exception as e:
+        return {'old_path': old_file, 'new_path': new_file, 'error': f"{type(e).__name__}: {e}"}
+    return diff_result_to_dict(result, show_unchanged)
+
+
 def print_semantic_diff(result: DiffResult, show_unchanged: bool = False):
     """Print semantic diff with rich formatting."""
     # Header
@@ -91,31 +176,37 @@ def print_semantic_diff(result: DiffResult, show_unchanged: bool = False):
         type_label = format_element_type(diff.element_type)
 
         if diff.change_type == ChangeType.ADDED:
+            new_lines = diff.new_content.split('\n')
+            new_nl_count = len(new_lines) - 1
             console.print(f"\n{marker} {type_label} (line {diff.new_line + 1})")
-            for line in diff.new_content.split('\n')[:5]:
-                console.print(f"  [green]{line}[/green]")
-            if diff.new_content.count('\n') > 5:
-                console.print(f"  [dim]... ({diff.new_content.count(chr(10)) - 4} more lines)[/dim]")
+            for line in new_lines[:5]:
+                console.print(Text(f"  {line}", style="green"))
+            if new_nl_count > 5:
+                console.print(f"  [dim]... ({new_nl_count - 4} more lines)[/dim]")
 
         elif diff.change_type == ChangeType.REMOVED:
+            old_lines = diff.old_content.split('\n')
+            old_nl_count = len(old_lines) - 1
             console.print(f"\n{marker} {type_label} (line {diff.old_line + 1})")
-            for line in diff.old_content.split('\n')[:5]:
-                console.print(f"  [red]{line}[/red]")
-            if diff.old_content.count('\n') > 5:
-                console.print(f"  [dim]... ({diff.old_content.count(chr(10)) - 4} more lines)[/dim]")
+            for line in old_lines[:5]:
+                console.print(Text(f"  {line}", style="red"))
+            if old_nl_count > 5:
+                console.print(f"  [dim]... ({old_nl_count - 4} more lines)[/dim]")
 
         elif diff.change_type == ChangeType.MODIFIED:
+            old_lines = diff.old_content.split('\n')
+            new_lines = diff.new_content.split('\n')
             similarity = diff.details.get('similarity', 0)
             console.print(f"\n{marker} {type_label} (lines {diff.old_line + 1} → {diff.new_line + 1}) [{similarity:.0%} similar]")
             console.print("  [red]Old:[/red]")
-            for line in diff.old_content.split('\n')[:3]:
-                console.print(f"    [red]{line}[/red]")
-            if diff.old_content.count('\n') > 3:
+            for line in old_lines[:3]:
+                console.print(Text(f"    {line}", style="red"))
+            if len(old_lines) > 4:
                 console.print(f"    [dim]...[/dim]")
             console.print("  [green]New:[/green]")
-            for line in diff.new_content.split('\n')[:3]:
-                console.print(f"    [green]{line}[/green]")
-            if diff.new_content.count('\n') > 3:
+            for line in new_lines[:3]:
+                console.print(Text(f"    {line}", style="green"))
+            if len(new_lines) > 4:
                 console.print(f"    [dim]...[/dim]")
 
     # Summary
@@ -140,6 +231,8 @@ def main():
 
         prompt-diff compare --format unified old.txt new.txt
 
+        prompt-diff compare-batch pairs.json
+
         prompt-diff parse prompt.txt
 
         prompt-diff variables prompt.txt
@@ -161,8 +254,8 @@ def compare(old_file: str, new_file: str, output_format: str, show_unchanged: bo
 
     Shows semantic differences including variable, instruction, and example changes.
     """
-    old_text = Path(old_file).read_text()
-    new_text = Path(new_file).read_text()
+    old_text = read_prompt_file(old_file)
+    new_text = read_prompt_file(new_file)
 
     if output_format == "unified":
         diff = format_unified_diff(old_text, new_text, old_file, new_file, context)
@@ -172,44 +265,24 @@ def compare(old_file: str, new_file: str, output_format: str, show_unchanged: bo
             console.print("[dim]No differences[/dim]")
 
     elif output_format == "side-by-side":
-        lines = format_side_by_side_diff(old_text, new_text)
         table = Table(show_header=True, header_style="bold")
         table.add_column("", width=1)
         table.add_column(old_file, style="red")
         table.add_column(new_file, style="green")
-        for marker, old_line, new_line in lines:
+        for marker, old_line, new_line in format_side_by_side_diff(old_text, new_text):
             if marker == ' ':
-                table.add_row(marker, old_line, new_line)
+                table.add_row(marker, Text(old_line), Text(new_line))
             elif marker == '<':
-                table.add_row("[red]<[/red]", f"[red]{old_line}[/red]", "")
+                table.add_row(Text("<", style="red"), Text(old_line, style="red"), "")
             elif marker == '>':
-                table.add_row("[green]>[/green]", "", f"[green]{new_line}[/green]")
+                table.add_row(Text(">", style="green"), "", Text(new_line, style="green"))
             else:
-                table.add_row("[yellow]|[/yellow]", f"[red]{old_line}[/red]", f"[green]{new_line}[/green]")
+                table.add_row(Text("|", style="yellow"), Text(old_line, style="red"), Text(new_line, style="green"))
         console.print(table)
 
     elif output_format == "json":
         result = diff_prompts(old_text, new_text, old_file, new_file)
-        output = {
-            'old_path': result.old_path,
-            'new_path': result.new_path,
-            'similarity': result.similarity,
-            'added_variables': list(result.added_variables),
-            'removed_variables': list(result.removed_variables),
-            'summary': result.summary,
-            'changes': [
-                {
-                    'type': d.change_type.value,
-                    'element_type': d.element_type.value,
-                    'old_content': d.old_content,
-                    'new_content': d.new_content,
-                    'old_line': d.old_line,
-                    'new_line': d.new_line,
-                }
-                for d in result.element_diffs
-                if d.change_type != ChangeType.UNCHANGED or show_unchanged
-            ],
-        }
+        output = diff_result_to_dict(result, show_unchanged)
         console.print_json(json.dumps(output, indent=2))
 
     else:  # semantic
@@ -220,6 +293,36 @@ def compare(old_file: str, new_file: str, output_format: str, show_unchanged: bo
             console.print("[dim]No differences[/dim]")
 
 
+@main.command("compare-batch")
+@click.argument("manifest_file", type=click.Path(exists=True, dir_okay=False))
+@click.option("--jobs", "-j", default=None, type=click.IntRange(min=1),
+              help="Number of worker processes (default: CPU count)")
+@click.option("--show-unchanged", "-u", is_flag=True, help="Include unchanged elements")
+def compare_batch(manifest_file: str, jobs: Optional[int], show_unchanged: bool):
+    """
+    Compare many pairs of prompt files listed in a manifest.
+
+    Pairs are diffed in parallel and written as JSON Lines, one result
+    per pair in manifest order. Pairs that fail are written with an
+    "error" field, and the command then exits with a non-zero status.
+    """
+    pairs = read_manifest(manifest_file)
+
+    if not pairs:
+        return
+
+    failed = 0
+    workers = min(jobs or os.cpu_count() or 1, len(pairs))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker) as executor:
+        for output in executor.map(_diff_pair, pairs, [show_unchanged] * len(pairs)):
+            if 'error' in output:
+                failed += 1
+            click.echo(json.dumps(output))
+
+    if failed:
+        raise click.ClickException(f"{failed} of {len(pairs)} pairs failed")
+
+
 @main.command()
 @click.argument("file", type=click.Path(exists=True))
 @click.option("--json-output", is_flag=True, help="Output as JSON")
@@ -227,7 +330,7 @@ def parse(file: str, json_output: bool):
     """
     Parse a prompt template and show its semantic structure.
     """
-    text = Path(file).read_text()
+    text = read_prompt_file(file)
     elements = parse_prompt(text)
 
     if json_output:
@@ -237,7 +340,7 @@ def parse(file: str, json_output: bool):
                 'content': e.content,
                 'line_start': e.line_start,
                 'line_end': e.line_end,
-                'metadata': e.metadata,
+                'metadata': e.metadata or {},
             }
             for e in elements
         ]
@@ -257,7 +360,7 @@ def parse(file: str, json_output: bool):
             preview = elem.content[:50].replace('\n', ' ')
             if len(elem.content) > 50:
                 preview += "..."
-            variables = ", ".join(elem.metadata.get('variables', []))
+            variables = ", ".join((elem.metadata or {}).get('variables', []))
 
             table.add_row(
                 lines,
@@ -275,7 +378,7 @@ def variables(file: str):
     """
     List all variables in a prompt template.
     """
-    text = Path(file).read_text()
+    text = read_prompt_file(file)
     elements = parse_prompt(text)
     vars = get_all_variables(elements)
 
@@ -6,9 +6,15 @@ between variables, instructions, examples, etc.
 """
 
 import difflib
+import io
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Optional
+from functools import cached_property
+from typing import Iterator, Optional
+
+import numpy as np
+from rapidfuzz import fuzz, process
+from rapidfuzz.distance import Levenshtein
 
 from .parser import PromptElement, PromptType, parse_prompt, get_all_variables
 
@@ -39,19 +45,19 @@ class DiffResult:
     old_path: str
     new_path: str
     element_diffs: list[ElementDiff]
-    old_variables: set[str]
-    new_variables: set[str]
-    added_variables: set[str]
-    removed_variables: set[str]
+    old_variables: frozenset[str]
+    new_variables: frozenset[str]
+    added_variables: frozenset[str]
+    removed_variables: frozenset[str]
     similarity: float  # 0.0 to 1.0
 
     @property
     def has_changes(self) -> bool:
         return any(d.change_type != ChangeType.UNCHANGED for d in self.element_diffs)
 
-    @property
+    @cached_property
     def summary(self) -> dict:
-        """Get a summary of changes."""
+        """Get a summary of changes, computed once on first access."""
         added = sum(1 for d in self.element_diffs if d.change_type == ChangeType.ADDED)
         removed = sum(1 for d in self.element_diffs if d.change_type == ChangeType.REMOVED)
         modified = sum(1 for d in self.element_diffs if d.change_type == ChangeType.MODIFIED)
@@ -66,6 +72,36 @@ class DiffResult:
         }
 
 
+def line_opcodes(old_lines: list[str], new_lines: list[str]) -> Iterator[tuple[str, int, int, int, int]]:
+    """
+    Yield difflib-style opcodes for two lists of lines.
+
+    Levenshtein can split one edited region into several adjacent
+    insert/delete/replace opcodes; each such run is merged into a single
+    block so lines pair up positionally, as with difflib.
+    """
+    run = None
+    for tag, i1, i2, j1, j2 in Levenshtein.opcodes(old_lines, new_lines):
+        if tag != 'equal':
+            run = (i1, i2, j1, j2) if run is None else (run[0], i2, run[2], j2)
+            continue
+        if run is not None:
+            yield _run_opcode(*run)
+            run = None
+        yield tag, i1, i2, j1, j2
+    if run is not None:
+        yield _run_opcode(*run)
+
+
+def _run_opcode(i1: int, i2: int, j1: int, j2: int) -> tuple[str, int, int, int, int]:
+    """Tag a merged run of non-equal opcodes."""
+    if i1 == i2:
+        return 'insert', i1, i2, j1, j2
+    if j1 == j2:
+        return 'delete', i1, i2, j1, j2
+    return 'replace', i1, i2, j1, j2
+
+
 def diff_lines(old_lines: list[str], new_lines: list[str]) -> list[tuple[str, str]]:
     """
     Diff two lists of lines and return tagged results.
@@ -74,11 +110,27 @@ def diff_lines(old_lines: list[str], new_lines: list[str]) -> list[tuple[str, st
     - ' ' (unchanged)
     - '+' (added)
     - '-' (removed)
-    - '?' (hints about modifications)
+
+    Replaced lines are reported as removals followed by additions.
     """
-    differ = difflib.Differ()
-    result = list(differ.compare(old_lines, new_lines))
-    return [(line[0], line[2:]) for line in result if line]
+    result = []
+
+    for tag, i1, i2, j1, j2 in line_opcodes(old_lines, new_lines):
+        if tag == 'equal':
+            result.extend((' ', line) for line in old_lines[i1:i2])
+            continue
+        result.extend(('-', line) for line in old_lines[i1:i2])
+        result.extend(('+', line) for line in new_lines[j1:j2])
+
+    return result
+
+
+# Minimum similarity for two elements to be aligned as a modification
+SIMILARITY_THRESHOLD = 0.5
+
+# Threads used to score element pairs; -1 uses every core. Callers that
+# already parallelize across processes should set this to 1.
+CDIST_WORKERS = -1
 
 
 def compute_similarity(old_text: str, new_text: str) -> float:
@@ -87,7 +139,20 @@ def compute_similarity(old_text: str, new_text: str) -> float:
         return 1.0
     if not old_text or not new_text:
         return 0.0
-    return difflib.SequenceMatcher(None, old_text, new_text).ratio()
+    return fuzz.ratio(old_text, new_text) / 100.0
+
+
+def _scorer_for(ptype: PromptType):
+    """
+    Pick the rapidfuzz scorer used to align elements of a given type.
+
+    Instructions and examples are compared with their tokens sorted, so
+    reordered sentences still match; everything else is compared character
+    by character.
+    """
+    if ptype in (PromptType.INSTRUCTION, PromptType.EXAMPLE):
+        return fuzz.token_sort_ratio
+    return fuzz.ratio
 
 
 def align_elements(
@@ -102,58 +167,110 @@ def align_elements(
     aligned = []
 
     # Filter out whitespace for matching purposes
-    old_filtered = [(i, e) for i, e in enumerate(old_elements) if e.type != PromptType.WHITESPACE]
-    new_filtered = [(i, e) for i, e in enumerate(new_elements) if e.type != PromptType.WHITESPACE]
-
-    old_used = set()
-    new_used = set()
-
-    # First pass: exact matches
-    for new_idx, new_elem in new_filtered:
-        for old_idx, old_elem in old_filtered:
-            if old_idx in old_used:
-                continue
-            if old_elem.type == new_elem.type and old_elem.content == new_elem.content:
-                aligned.append((old_elem, new_elem))
-                old_used.add(old_idx)
-                new_used.add(new_idx)
-                break
-
-    # Second pass: similar matches (modified elements)
-    for new_idx, new_elem in new_filtered:
-        if new_idx in new_used:
+    old_filtered = [e for e in old_elements if e.type != PromptType.WHITESPACE]
+    new_filtered = [e for e in new_elements if e.type != PromptType.WHITESPACE]
+
+    old_matched = np.zeros(len(old_filtered), dtype=bool)
+    new_matched = np.zeros(len(new_filtered), dtype=bool)
+
+    # First pass: exact matches, looked up by (type, content)
+    exact = {}
+    for old_idx, old_elem in enumerate(old_filtered):
+        exact.setdefault((old_elem.type, old_elem.content), []).append(old_idx)
+
+    for new_idx, new_elem in enumerate(new_filtered):
+        candidates = exact.get((new_elem.type, new_elem.content))
+        if candidates:
+            old_idx = candidates.pop(0)
+            aligned.append((old_filtered[old_idx], new_elem))
+            old_matched[old_idx] = True
+            new_matched[new_idx] = True
+
+    # Second pass: similar matches (modified elements). Different types
+    # never align, so each type is scored and solved on its own.
+    old_by_type = {}
+    new_by_type = {}
+    for old_idx in np.flatnonzero(~old_matched):
+        old_by_type.setdefault(old_filtered[old_idx].type, []).append(old_idx)
+    for new_idx in np.flatnonzero(~new_matched):
+        new_by_type.setdefault(new_filtered[new_idx].type, []).append(new_idx)
+
+    similar = []
+    for ptype, new_remaining in new_by_type.items():
+        old_remaining = old_by_type.get(ptype)
+        if not old_remaining:
             continue
-        best_match = None
-        best_score = 0.5  # Minimum similarity threshold
-
-        for old_idx, old_elem in old_filtered:
-            if old_idx in old_used:
-                continue
-            if old_elem.type == new_elem.type:
-                score = compute_similarity(old_elem.content, new_elem.content)
-                if score > best_score:
-                    best_score = score
-                    best_match = (old_idx, old_elem)
-
-        if best_match:
-            old_idx, old_elem = best_match
-            aligned.append((old_elem, new_elem))
-            old_used.add(old_idx)
-            new_used.add(new_idx)
+
+        # Score every (new, old) pair in one batched call; pairs below the
+        # threshold are rejected early and come back as 0.
+        scores = process.cdist(
+            [new_filtered[i].content for i in new_remaining],
+            [old_filtered[i].content for i in old_remaining],
+            scorer=_scorer_for(ptype),
+            score_cutoff=SIMILARITY_THRESHOLD * 100,
+            workers=CDIST_WORKERS,
+        )
+
+        # Optimal one-to-one matching; pairs at or below the threshold are
+        # left unaligned. A single row or column only needs its best entry.
+        if len(new_remaining) == 1 or len(old_remaining) == 1:
+            pairs = [np.unravel_index(np.argmax(scores), scores.shape)]
+        else:
+            # Imported lazily: scipy.optimize dominates CLI startup time and
+            # most commands never align anything.
+            from scipy.optimize import linear_sum_assignment
+            pairs = zip(*linear_sum_assignment(scores, maximize=True))
+        for row, col in pairs:
+            if scores[row, col] > SIMILARITY_THRESHOLD * 100:
+                similar.append((new_remaining[row], old_remaining[col]))
+
+    # Keep modified pairs in the order they appear in the new prompt
+    for new_idx, old_idx in sorted(similar):
+        aligned.append((old_filtered[old_idx], new_filtered[new_idx]))
+        old_matched[old_idx] = True
+        new_matched[new_idx] = True
 
     # Remaining old elements (removed)
-    for old_idx, old_elem in old_filtered:
-        if old_idx not in old_used:
+    for old_elem, matched in zip(old_filtered, old_matched):
+        if not matched:
             aligned.append((old_elem, None))
 
     # Remaining new elements (added)
-    for new_idx, new_elem in new_filtered:
-        if new_idx not in new_used:
+    for new_elem, matched in zip(new_filtered, new_matched):
+        if not matched:
             aligned.append((None, new_elem))
 
     return aligned
 
 
+def _diff_identical(text: str, old_path: str, new_path: str) -> DiffResult:
+    """Build the diff of a prompt against itself without aligning anything."""
+    elements = parse_prompt(text)
+    variables = frozenset(get_all_variables(elements))
+
+    return DiffResult(
+        old_path=old_path,
+        new_path=new_path,
+        element_diffs=[
+            ElementDiff(
+                change_type=ChangeType.UNCHANGED,
+                element_type=element.type,
+                old_content=element.content,
+                new_content=element.content,
+                old_line=element.line_start,
+                new_line=element.line_start,
+            )
+            for element in elements
+            if element.type != PromptType.WHITESPACE
+        ],
+        old_variables=variables,
+        new_variables=variables,
+        added_variables=frozenset(),
+        removed_variables=frozenset(),
+        similarity=1.0,
+    )
+
+
 def diff_prompts(
     old_text: str,
     new_text: str,
@@ -172,11 +289,14 @@ def diff_prompts(
     Returns:
         DiffResult with detailed element-by-element comparison
     """
+    if old_text == new_text:
+        return _diff_identical(old_text, old_path, new_path)
+
     old_elements = parse_prompt(old_text)
     new_elements = parse_prompt(new_text)
 
-    old_variables = get_all_variables(old_elements)
-    new_variables = get_all_variables(new_elements)
+    old_variables = frozenset(get_all_variables(old_elements))
+    new_variables = frozenset(get_all_variables(new_elements))
 
     aligned = align_elements(old_elements, new_elements)
     element_diffs = []
@@ -245,51 +365,47 @@ def format_unified_diff(
     old_lines = old_text.splitlines(keepends=True)
     new_lines = new_text.splitlines(keepends=True)
 
-    diff = difflib.unified_diff(
+    buf = io.StringIO()
+    buf.writelines(difflib.unified_diff(
         old_lines,
         new_lines,
         fromfile=old_path,
         tofile=new_path,
         lineterm='',
         n=context_lines,
-    )
-    return ''.join(diff)
+    ))
+    return buf.getvalue()
 
 
 def format_side_by_side_diff(
     old_text: str,
     new_text: str,
     width: int = 80,
-) -> list[tuple[str, str, str]]:
+) -> Iterator[tuple[str, str, str]]:
     """
     Generate side-by-side diff.
 
-    Returns list of (marker, old_line, new_line) tuples.
+    Yields (marker, old_line, new_line) tuples.
     Marker is one of: ' ' (same), '<' (removed), '>' (added), '|' (modified)
     """
     old_lines = old_text.splitlines()
     new_lines = new_text.splitlines()
 
-    matcher = difflib.SequenceMatcher(None, old_lines, new_lines)
-    result = []
-
     half_width = (width - 3) // 2
 
-    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+    for tag, i1, i2, j1, j2 in line_opcodes(old_lines, new_lines):
         if tag == 'equal':
             for i in range(i1, i2):
-                result.append((' ', old_lines[i][:half_width], new_lines[j1 + (i - i1)][:half_width]))
+                yield (' ', old_lines[i][:half_width], new_lines[j1 + (i - i1)][:half_width])
         elif tag == 'replace':
             max_len = max(i2 - i1, j2 - j1)
             for k in range(max_len):
                 old_line = old_lines[i1 + k][:half_width] if i1 + k < i2 else ''
                 new_line = new_lines[j1 + k][:half_width] if j1 + k < j2 else ''
-                result.append(('|', old_line, new_line))
+                yield ('|', old_line, new_line)
         elif tag == 'delete':
             for i in range(i1, i2):
-                result.append(('<', old_lines[i][:half_width], ''))
+                yield ('<', old_lines[i][:half_width], '')
         elif tag == 'insert':
             for j in range(j1, j2):
-                result.append(('>', '', new_lines[j][:half_width]))
-
-    return result
+                yield ('>', '', new_lines[j][:half_width])
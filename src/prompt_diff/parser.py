@@ -6,7 +6,10 @@ in prompt templates.
 """
 
 import re
-from dataclasses import dataclass
+from collections import Counter
+from copy import deepcopy
+from dataclasses import dataclass, replace
+from functools import lru_cache
 from enum import Enum
 from typing import Iterator
 
@@ -22,7 +25,7 @@ class PromptType(Enum):
     WHITESPACE = "whitespace"      # Significant whitespace
 
 
-@dataclass
+@dataclass(slots=True)
 class PromptElement:
     """A semantic element in a prompt template."""
     type: PromptType
@@ -30,32 +33,44 @@ class PromptElement:
     line_start: int
     line_end: int
     raw: str  # Original text including delimiters
-    metadata: dict = None
+    metadata: dict | None = None  # None for comments and whitespace
 
-    def __post_init__(self):
-        if self.metadata is None:
-            self.metadata = {}
 
-
-# Variable patterns for different template syntaxes
+# Variable patterns for different template syntaxes. Each pattern captures
+# the variable name in a group named "<syntax>_name".
 VARIABLE_PATTERNS = [
     # Jinja2: {{ variable }} or {{ variable | filter }}
-    (r'\{\{\s*([a-zA-Z_][a-zA-Z0-9_]*(?:\s*\|\s*[a-zA-Z_][a-zA-Z0-9_]*)*)\s*\}\}', 'jinja2'),
+    (r'\{\{\s*(?P<jinja2_name>[a-zA-Z_][a-zA-Z0-9_]*(?:\s*\|\s*[a-zA-Z_][a-zA-Z0-9_]*)*)\s*\}\}', 'jinja2'),
     # Jinja2 blocks: {% if %}, {% for %}, etc.
-    (r'\{%\s*([a-zA-Z_]+(?:\s+[^%]+)?)\s*%\}', 'jinja2_block'),
+    (r'\{%\s*(?P<jinja2_block_name>[a-zA-Z_]+(?:\s+[^%]+)?)\s*%\}', 'jinja2_block'),
     # Mustache: {{variable}} or {{{variable}}}
-    (r'\{\{\{?\s*([a-zA-Z_][a-zA-Z0-9_.]*)\s*\}\}\}?', 'mustache'),
+    (r'\{\{\{?\s*(?P<mustache_name>[a-zA-Z_][a-zA-Z0-9_.]*)\s*\}\}\}?', 'mustache'),
     # Python f-string style: {variable} or {variable:format}
-    (r'\{([a-zA-Z_][a-zA-Z0-9_]*)(?::[^}]*)?\}', 'fstring'),
+    (r'\{(?P<fstring_name>[a-zA-Z_][a-zA-Z0-9_]*)(?::[^}]*)?\}', 'fstring'),
     # Shell style: ${variable} or $variable
-    (r'\$\{([a-zA-Z_][a-zA-Z0-9_]*)\}', 'shell_brace'),
-    (r'\$([a-zA-Z_][a-zA-Z0-9_]*)', 'shell'),
+    (r'\$\{(?P<shell_brace_name>[a-zA-Z_][a-zA-Z0-9_]*)\}', 'shell_brace'),
+    (r'\$(?P<shell_name>[a-zA-Z_][a-zA-Z0-9_]*)', 'shell'),
     # XML-style: <variable/> or <variable>
-    (r'<([A-Z_][A-Z0-9_]*)(?:\s*/>|>)', 'xml'),
+    (r'<(?P<xml_name>[A-Z_][A-Z0-9_]*)(?:\s*/>|>)', 'xml'),
     # Placeholder style: [VARIABLE] or [[VARIABLE]]
-    (r'\[\[?([A-Z_][A-Z0-9_]*)\]?\]', 'placeholder'),
+    (r'\[\[?(?P<placeholder_name>[A-Z_][A-Z0-9_]*)\]?\]', 'placeholder'),
 ]
 
+# Variable pattern syntaxes that count towards a broader template syntax
+SYNTAX_FAMILIES = {
+    'jinja2_block': 'jinja2',
+    'shell_brace': 'shell',
+}
+
+# Template syntaxes in priority order, used to break ties in detection
+TEMPLATE_SYNTAXES = ('jinja2', 'mustache', 'fstring', 'shell', 'xml', 'placeholder')
+
+# All variable patterns fused into one alternation, so text is scanned once.
+# Earlier patterns win when several match at the same position, and a match
+# consumes its whole span: variables nested inside another match, such as
+# {items} in {% for item in {items} %}, are not reported separately.
+_VAR_RE = re.compile('|'.join(f'(?P<{syntax}>{pattern})' for pattern, syntax in VARIABLE_PATTERNS))
+
 # Instruction keywords that typically start instruction lines
 INSTRUCTION_KEYWORDS = [
     'you are', 'you must', 'you should', 'you will', 'you can',
@@ -70,69 +85,89 @@ INSTRUCTION_KEYWORDS = [
     '-', '*', '•',
 ]
 
+# Instruction keywords compiled into one anchored alternation, longest first
+_INSTR_RE = re.compile(
+    '|'.join(re.escape(kw) for kw in sorted(INSTRUCTION_KEYWORDS, key=len, reverse=True)),
+    re.IGNORECASE,
+)
+
 # Role markers
-ROLE_PATTERNS = [
+ROLE_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in [
     r'^(system|user|assistant|human|ai|bot):\s*',
     r'^<(system|user|assistant|human|ai)>',
     r'^\[(system|user|assistant|human|ai)\]',
-]
+]]
 
 # Example block patterns
-EXAMPLE_PATTERNS = [
+EXAMPLE_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in [
     r'^example\s*\d*:?\s*$',
     r'^input:\s*$',
     r'^output:\s*$',
     r'^expected:\s*$',
     r'^sample:\s*$',
     r'^```',  # Code blocks often contain examples
-]
+]]
 
+# Line classifiers fused into one alternation, in the order parse_prompt
+# checks them; the named group that matched gives the line's kind.
+_LINE_RE = re.compile('|'.join([
+    '(?P<role>{})'.format('|'.join(p.pattern for p in ROLE_PATTERNS)),
+    r'(?P<comment>#|//)',
+    '(?P<example>{})'.format('|'.join(p.pattern for p in EXAMPLE_PATTERNS)),
+    f'(?P<instruction>{_INSTR_RE.pattern})',
+]), re.IGNORECASE)
 
-def detect_template_syntax(text: str) -> str:
-    """Detect the primary template syntax used in a prompt."""
-    syntax_counts = {
-        'jinja2': len(re.findall(r'\{\{.*?\}\}|\{%.*?%\}', text)),
-        'mustache': len(re.findall(r'\{\{\{?[^{].*?\}\}\}?', text)),
-        'fstring': len(re.findall(r'\{[a-zA-Z_][a-zA-Z0-9_]*\}', text)),
-        'shell': len(re.findall(r'\$[{a-zA-Z_]', text)),
-        'xml': len(re.findall(r'<[A-Z_]+(?:\s*/>|>)', text)),
-        'placeholder': len(re.findall(r'\[\[?[A-Z_]+\]?\]', text)),
-    }
 
-    if max(syntax_counts.values()) == 0:
-        return 'plain'
+def scan_text(text: str) -> tuple[str, list[tuple[str, str, int, int]]]:
+    """
+    Scan text once for template variables.
 
-    return max(syntax_counts, key=syntax_counts.get)
+    Returns the primary template syntax (or 'plain' if no variables were
+    found) together with all variables as (name, syntax, start, end)
+    tuples in position order.
+    """
+    variables = []
+    syntax_counts = Counter()
 
+    for match in _VAR_RE.finditer(text):
+        syntax = match.lastgroup
+        family = SYNTAX_FAMILIES.get(syntax, syntax)
+        # {{ a.b }} is Jinja2 attribute access too; only {{{ }}} is mustache-only
+        if syntax == 'mustache' and not match.group().startswith('{{{'):
+            family = 'jinja2'
+        syntax_counts[family] += 1
+        variables.append((
+            match.group(f'{syntax}_name'),  # Variable name
+            syntax,                         # Syntax type
+            match.start(),                  # Start position
+            match.end(),                    # End position
+        ))
 
-def extract_variables(text: str) -> list[tuple[str, str, int, int]]:
-    """Extract all variables from text with their positions."""
-    variables = []
+    if not syntax_counts:
+        return 'plain', variables
+
+    return max(TEMPLATE_SYNTAXES, key=syntax_counts.__getitem__), variables
+
+
+def detect_template_syntax(text: str) -> str:
+    """Detect the primary template syntax used in a prompt."""
+    return scan_text(text)[0]
 
-    for pattern, syntax in VARIABLE_PATTERNS:
-        for match in re.finditer(pattern, text):
-            variables.append((
-                match.group(1),  # Variable name
-                syntax,          # Syntax type
-                match.start(),   # Start position
-                match.end(),     # End position
-            ))
 
-    # Sort by position
-    variables.sort(key=lambda x: x[2])
-    return variables
+def extract_variables(text: str) -> list[tuple[str, str, int, int]]:
+    """Extract all variables from text with their positions."""
+    return scan_text(text)[1]
 
 
 def is_instruction_line(line: str) -> bool:
     """Check if a line is an instruction."""
-    line_lower = line.lower().strip()
-    return any(line_lower.startswith(kw) for kw in INSTRUCTION_KEYWORDS)
+    return _INSTR_RE.match(line.strip()) is not None
 
 
 def is_role_marker(line: str) -> tuple[bool, str | None]:
     """Check if a line is a role marker."""
     for pattern in ROLE_PATTERNS:
-        match = re.match(pattern, line, re.IGNORECASE)
+        match = pattern.match(line)
         if match:
             return True, match.group(1).lower()
     return False, None
@@ -141,7 +176,7 @@ def is_role_marker(line: str) -> tuple[bool, str | None]:
 def is_example_marker(line: str) -> bool:
     """Check if a line marks the start of an example."""
     line_lower = line.lower().strip()
-    return any(re.match(pattern, line_lower, re.IGNORECASE) for pattern in EXAMPLE_PATTERNS)
+    return any(pattern.match(line_lower) for pattern in EXAMPLE_PATTERNS)
 
 
 def parse_prompt(text: str) -> list[PromptElement]:
@@ -149,11 +184,21 @@ def parse_prompt(text: str) -> list[PromptElement]:
     Parse a prompt template into semantic elements.
 
     Returns a list of PromptElement objects representing the
-    semantic structure of the prompt.
+    semantic structure of the prompt. Results are cached by text, and
+    each call returns fresh copies that are safe to modify.
     """
+    return [
+        replace(element, metadata=deepcopy(element.metadata))
+        for element in _parse_prompt_cached(text)
+    ]
+
+
+@lru_cache(maxsize=128)
+def _parse_prompt_cached(text: str) -> tuple[PromptElement, ...]:
+    """Parse a prompt template; see parse_prompt."""
     elements = []
     lines = text.split('\n')
-    syntax = detect_template_syntax(text)
+    syntax, _ = scan_text(text)
 
     in_example = False
     in_code_block = False
@@ -196,9 +241,12 @@ def parse_prompt(text: str) -> list[PromptElement]:
             current_element_lines.append(line)
             continue
 
+        match = _LINE_RE.match(stripped)
+        kind = match.lastgroup if match else None
+
         # Check for role marker
-        is_role, role_name = is_role_marker(stripped)
-        if is_role:
+        if kind == 'role':
+            _, role_name = is_role_marker(stripped)
             flush_element()
             elements.append(PromptElement(
                 type=PromptType.ROLE,
@@ -211,7 +259,7 @@ def parse_prompt(text: str) -> list[PromptElement]:
             continue
 
         # Check for comment
-        if stripped.startswith('#') or stripped.startswith('//'):
+        if kind == 'comment':
             flush_element()
             elements.append(PromptElement(
                 type=PromptType.COMMENT,
@@ -223,7 +271,7 @@ def parse_prompt(text: str) -> list[PromptElement]:
             continue
 
         # Check for example marker
-        if is_example_marker(stripped):
+        if kind == 'example':
             flush_element()
             in_example = True
             element_start_line = i
@@ -232,7 +280,7 @@ def parse_prompt(text: str) -> list[PromptElement]:
             continue
 
         # Check for instruction
-        if is_instruction_line(stripped) and not in_example:
+        if kind == 'instruction' and not in_example:
             if current_element_type != PromptType.INSTRUCTION:
                 flush_element()
                 element_start_line = i
@@ -266,20 +314,23 @@ def parse_prompt(text: str) -> list[PromptElement]:
     # Flush any remaining element
     flush_element()
 
-    # Now extract variables and annotate elements
+    # Now extract variables and annotate elements, scanning each distinct
+    # content only once
+    scanned = {}
     for element in elements:
         if element.type in (PromptType.TEXT, PromptType.INSTRUCTION, PromptType.EXAMPLE):
-            vars = extract_variables(element.content)
-            if vars:
-                element.metadata['variables'] = [v[0] for v in vars]
+            if element.content not in scanned:
+                scanned[element.content] = [v[0] for v in scan_text(element.content)[1]]
+            if scanned[element.content]:
+                element.metadata['variables'] = list(scanned[element.content])
 
-    return elements
+    return tuple(elements)
 
 
 def get_all_variables(elements: list[PromptElement]) -> set[str]:
     """Get all variable names from parsed elements."""
-    variables = set()
-    for element in elements:
-        if 'variables' in element.metadata:
-            variables.update(element.metadata['variables'])
-    return variables
+    return set().union(*(
+        element.metadata.get('variables', ())
+        for element in elements
+        if element.metadata is not None
+    ))